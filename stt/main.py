@@ -407,7 +407,12 @@ async def chat_with_llama(
 
 async def generate_tts(websocket: WebSocket, text: str):
     tts_url = "http://localhost:8001/tts"
-    tts_data = {"text": text}
+    # Ask for compressed audio so less data is cached, relayed and buffered by the client
+    tts_data = {
+        "text": text,
+        "format": os.getenv("TTS_AUDIO_FORMAT", "mp3"),
+        "sample_rate": int(os.getenv("TTS_SAMPLE_RATE", 24000))
+    }
     try:
         print(f"Sending TTS request: {text[:100]}...")  # Log the first 100 characters of the text
         tts_response = await asyncio.to_thread(requests.post, tts_url, json=tts_data, timeout=360)
@@ -1,12 +1,15 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
 from tortoise.api import TextToSpeech
+import asyncio
 import io
 import soundfile as sf
+import soxr
 import torch
 from pydantic import BaseModel
+from typing import Optional
 import redis
 import hashlib
 import time
@@ -29,25 +32,103 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 tts = TextToSpeech(use_deepspeed=torch.cuda.is_available(), kv_cache=True, half=True, device=device)
 print(f"Using device: {device}")
 
+# Native output rate of Tortoise-TTS
+TTS_SAMPLE_RATE = 24000
+# Rates we can downsample to; all of them are valid for every format below
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 24000)
+
+# format name -> (soundfile format, soundfile subtype, media type)
+AUDIO_FORMATS = {
+    "wav": ("WAV", "PCM_16", "audio/wav"),
+    "flac": ("FLAC", "PCM_16", "audio/flac"),
+    "ogg": ("OGG", "OPUS", "audio/ogg"),
+    "mp3": ("MP3", "MPEG_LAYER_III", "audio/mpeg"),
+}
+DEFAULT_AUDIO_FORMAT = "wav"
+
+# Accept header media types -> format name
+MEDIA_TYPE_FORMATS = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/ogg": "ogg",
+    "audio/opus": "ogg",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+}
+
 class TTSRequest(BaseModel):
     text: str
+    format: Optional[str] = None
+    sample_rate: Optional[int] = None
+
+def get_cache_key(text: str, audio_format: str, sample_rate: int) -> str:
+    """Generate a cache key based on the input text and output encoding."""
+    return f"tts:{hashlib.md5(text.encode()).hexdigest()}:{audio_format}:{sample_rate}"
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Pick the output format from the request field, falling back to the Accept header."""
+    if requested:
+        audio_format = requested.lower()
+        if audio_format not in AUDIO_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported audio format: {requested}. Supported formats: {', '.join(AUDIO_FORMATS)}"
+            )
+        return audio_format
+
+    if accept:
+        candidates = []
+        for index, part in enumerate(accept.split(",")):
+            media_type, *params = [p.strip() for p in part.split(";")]
+            quality = 1.0
+            for param in params:
+                if param.startswith("q="):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        quality = 0.0
+            if quality > 0:
+                candidates.append((-quality, index, media_type.lower()))
+        for _, _, media_type in sorted(candidates):
+            if media_type in MEDIA_TYPE_FORMATS:
+                return MEDIA_TYPE_FORMATS[media_type]
+
+    return DEFAULT_AUDIO_FORMAT
 
-def get_cache_key(text: str) -> str:
-    """Generate a cache key based on the input text."""
-    return f"tts:{hashlib.md5(text.encode()).hexdigest()}"
+def encode_audio(samples, audio_format: str, sample_rate: int) -> bytes:
+    """Resample (if needed) and encode raw samples into the requested container."""
+    if sample_rate != TTS_SAMPLE_RATE:
+        samples = soxr.resample(samples, TTS_SAMPLE_RATE, sample_rate)
+    sf_format, sf_subtype, _ = AUDIO_FORMATS[audio_format]
+    audio_buffer = io.BytesIO()
+    sf.write(audio_buffer, samples, sample_rate, format=sf_format, subtype=sf_subtype)
+    return audio_buffer.getvalue()
 
 @app.post("/tts")
-async def text_to_speech(request: TTSRequest):
+async def text_to_speech(request: TTSRequest, accept: Optional[str] = Header(None)):
     start_time = time.time()
+    audio_format = negotiate_format(request.format, accept)
+    sample_rate = request.sample_rate or TTS_SAMPLE_RATE
+    if sample_rate not in SUPPORTED_SAMPLE_RATES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported sample rate: {sample_rate}. Supported rates: {', '.join(map(str, SUPPORTED_SAMPLE_RATES))}"
+        )
+    media_type = AUDIO_FORMATS[audio_format][2]
+    # The body depends on Accept when no explicit format is given
+    headers = {"Vary": "Accept"}
     try:
         if redis_client:
-            cache_key = get_cache_key(request.text)
+            cache_key = get_cache_key(request.text, audio_format, sample_rate)
             try:
                 # Try to get the audio data from cache
                 cached_audio = redis_client.get(cache_key)
                 if cached_audio:
                     print(f"Cache hit. Returning cached audio data. Time taken: {time.time() - start_time:.2f} seconds")
-                    return Response(content=cached_audio, media_type="audio/wav")
+                    return Response(content=cached_audio, media_type=media_type, headers=headers)
             except redis.RedisError as e:
                 print(f"Redis error: {str(e)}. Proceeding without caching.")
         
@@ -58,13 +139,11 @@ async def text_to_speech(request: TTSRequest):
         gen = tts.tts_with_preset(request.text, preset="ultra_fast")
         gen_time = time.time() - gen_start_time
         print(f"Audio generation completed. Time taken: {gen_time:.2f} seconds")
-        # Convert the generated audio to bytes
+        # Encode the generated audio off the event loop
         conv_start_time = time.time()
-        audio_buffer = io.BytesIO()
-        sf.write(audio_buffer, gen.squeeze().cpu().numpy(), 24000, format='WAV', subtype='PCM_16')
-        audio_data = audio_buffer.getvalue()
+        audio_data = await asyncio.to_thread(encode_audio, gen.squeeze().cpu().numpy(), audio_format, sample_rate)
         conv_time = time.time() - conv_start_time
-        print(f"Audio conversion completed. Time taken: {conv_time:.2f} seconds")
+        print(f"Audio conversion to {audio_format} at {sample_rate} Hz completed ({len(audio_data)} bytes). Time taken: {conv_time:.2f} seconds")
         
         
         # audio_file_path = './sample_denoised.wav'  # Replace with your actual file path
@@ -94,7 +173,7 @@ async def text_to_speech(request: TTSRequest):
         total_time = time.time() - start_time
         print(f"TTS generation successful. Total time taken: {total_time:.2f} seconds")
         # Return the audio data as a response
-        return Response(content=audio_data, media_type="audio/wav")
+        return Response(content=audio_data, media_type=media_type, headers=headers)
     except Exception as e:
         print(f"Error in TTS processing: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process TTS request: {str(e)}")